@@ -4,25 +4,119 @@
 import nbformat
 import json
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import datetime
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import papermill as pm
 from papermill.iorw import papermill_io, HttpHandler
 from cortexutils.analyzer import Analyzer
 from nbconvert import HTMLExporter
 from tornado import gen
+from tornado.concurrent import Future
 from tornado.escape import json_encode, json_decode, url_escape
-from tornado.websocket import websocket_connect
+from tornado.websocket import websocket_connect, WebSocketClosedError
 from tornado.ioloop import IOLoop
-from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.iostream import StreamClosedError
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest, HTTPClientError
 from uuid import uuid4
 
+# Use orjson for the kernel messages when available (faster JSON encoding/decoding)
+try:
+    import orjson
+
+    def json_dumps(obj):
+        return orjson.dumps(obj).decode("utf-8")
+
+    json_loads = orjson.loads
+except ImportError:
+    json_dumps = json_encode
+    json_loads = json_decode
+
+# Use libcurl for the async HTTP calls when available (keep-alive and faster requests)
+try:
+    AsyncHTTPClient.configure(
+        "tornado.curl_httpclient.CurlAsyncHTTPClient", max_clients=16
+    )
+except ImportError:
+    pass
+
+
+@functools.lru_cache(maxsize=1)
+def get_html_exporter():
+    """This is used to build the HTML exporter only once per process, as it can't be shared between processes
+
+    Returns:
+        HTMLExporter: Exporter used to render the notebooks as HTML reports
+    """
+    html_exporter = HTMLExporter(template_name="classic")
+    # Render an empty notebook to load and compile the templates once
+    html_exporter.from_notebook_node(nbformat.v4.new_notebook())
+    return html_exporter
+
+
+def render_html(nb):
+    """This is used to render a notebook as an HTML report
+
+    Args:
+        nb (nbformat<NotebookNode>): Notebook structure
+
+    Returns:
+        str: HTML body of the notebook
+    """
+    (body, ressources) = get_html_exporter().from_notebook_node(nb)
+    return body
+
+
+def stream_output(msg):
+    """This is used to build a notebook output from a kernel stream message without schema validation
+
+    Args:
+        msg (dict): Message of type "stream" received from the kernel
+
+    Returns:
+        nbformat<NotebookNode>: Stream output following the nbformat v4 schema
+    """
+    content = msg["content"]
+    return nbformat.NotebookNode(
+        output_type="stream", name=content["name"], text=content["text"]
+    )
+
+
+def display_output(msg):
+    """This is used to build a notebook output from a kernel display_data message without schema validation
+
+    Args:
+        msg (dict): Message of type "display_data" received from the kernel
+
+    Returns:
+        nbformat<NotebookNode>: Display data output following the nbformat v4 schema
+    """
+    content = msg["content"]
+    return nbformat.NotebookNode(
+        output_type="display_data",
+        data=content["data"],
+        metadata=content.get("metadata", {}),
+    )
+
 
 class Jupyter(Analyzer):
     def __init__(self):
         """Initialize the Jupyter analyzer"""
         Analyzer.__init__(self)
 
+        # Share a single HTTP session to keep connections alive between the REST API calls
+        self.http_session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        self.http_session.mount("http://", adapter)
+        self.http_session.mount("https://", adapter)
+
+        # Remote kernel and websocket, reused for all the notebooks
+        self.kernel_id = None
+        self.kernel_ws = None
+
         # Initialize the ouput folder
         self.output_folder = self.get_param(
             "config.output_folder",
@@ -97,6 +191,31 @@ class Jupyter(Analyzer):
             ),
         }
 
+        # Precompute the static parts of the output notebook paths
+        if self.get_conf("output", "is_http"):
+            self.output_prefix = "{0}/{1}/{2}-".format(
+                self.get_conf("output", "server_uri_http_api_contents"),
+                self.output_folder,
+                self.id,
+            )
+            self.output_suffix = "?token={0}".format(
+                self.get_conf("output", "handler_http_service_api_token")
+            )
+            self.output_prefix_direct = "{0}/user/{1}/tree/{2}/{3}-".format(
+                self.get_conf("output", "hostname"),
+                self.get_conf("output", "handler_http_user"),
+                self.output_folder,
+                self.id,
+            )
+        else:
+            self.output_prefix = "{0}/{1}/{2}-".format(
+                self.get_conf("output", "hostname"),
+                self.output_folder,
+                self.id,
+            )
+            self.output_suffix = ""
+            self.output_prefix_direct = self.output_prefix
+
     def initialize_path(
         self,
         hostname,
@@ -104,9 +223,11 @@ class Jupyter(Analyzer):
         handler_http_is_jupyterhub=False,
     ):
         # Prepare result
+        handler_type = papermill_io.get_handler(hostname)
         result = {
             "hostname": hostname,
-            "handler_type": papermill_io.get_handler(hostname),
+            "handler_type": handler_type,
+            "is_http": handler_type is HttpHandler,
             "handler_http_service_api_token": handler_http_service_api_token,
             "handler_http_is_jupyterhub": handler_http_is_jupyterhub,
             "handler_http_headers": None,
@@ -117,7 +238,7 @@ class Jupyter(Analyzer):
             "server_uri_ws_api_kernels": None,
         }
 
-        if result["handler_type"] is HttpHandler:
+        if result["is_http"]:
             # Build the header for authorization/authentication
             if (
                 handler_http_service_api_token is not None
@@ -150,11 +271,13 @@ class Jupyter(Analyzer):
             # If JupyterHub instance, then start the server first
             if handler_http_is_jupyterhub is True:
                 # It's a JupyterHub instance, get the server name started
-                result["server"] = self.start_server(
-                    hostname,
-                    result["handler_http_user"],
-                    server_name="cortex_job",
-                    headers=result["handler_http_headers"],
+                result["server"] = IOLoop.current().run_sync(
+                    lambda: self.start_server(
+                        hostname,
+                        result["handler_http_user"],
+                        server_name="cortex_job",
+                        headers=result["handler_http_headers"],
+                    )
                 )
                 result["server_uri_http_api_contents"] = (
                     result["server"] + "api/contents"
@@ -252,51 +375,86 @@ class Jupyter(Analyzer):
 
         return {"taxonomies": taxonomies}
 
-    def event_stream(self, url, headers=""):
-        """Generator yielding events from a JSON event stream
+    @gen.coroutine
+    def event_stream(self, url, headers=None):
+        """Wait for the ready event of a JSON event stream
 
         For use with the server progress API
+
+        Returns the ready event, or None if the stream ended without it
         """
-        r = requests.get(url, headers=headers, stream=True)
-        for line in r.iter_lines():
-            line = line.decode("utf8", "replace")
-            # event lines all start with `data:`
-            # all other lines should be ignored (they will be empty)
-            if line.startswith("data:"):
-                yield json.loads(line.split(":", 1)[1])
-
-    def start_server(self, hub_url, user, server_name="", headers=""):
+        ready = Future()
+        buffer = [b""]
+
+        def on_chunk(chunk):
+            if ready.done():
+                return
+            # Only handle complete lines, keep the remaining part for the next chunk
+            lines = (buffer[0] + chunk).split(b"\n")
+            buffer[0] = lines.pop()
+            for line in lines:
+                line = line.decode("utf8", "replace")
+                # event lines all start with `data:`
+                # all other lines should be ignored (they will be empty)
+                if line.startswith("data:"):
+                    event = json_loads(line.split(":", 1)[1])
+                    if event.get("ready"):
+                        ready.set_result(event)
+                        return
+
+        def on_done(fetch):
+            if ready.done():
+                return
+            if fetch.exception() is not None:
+                ready.set_exception(fetch.exception())
+            else:
+                ready.set_result(None)
+
+        fetch = AsyncHTTPClient().fetch(
+            HTTPRequest(
+                url, headers=headers, streaming_callback=on_chunk, request_timeout=0
+            )
+        )
+        fetch.add_done_callback(on_done)
+
+        event = yield ready
+        return event
+
+    @gen.coroutine
+    def start_server(self, hub_url, user, server_name="", headers=None):
         """Start a server for a jupyterhub user
 
         Returns the full URL for accessing the server
         """
         user_url = f"{hub_url}/hub/api/users/{user}"
         log_name = f"{user}/{server_name}".rstrip("/")
+        client = AsyncHTTPClient()
 
         # step 1: get user status
-        r = requests.get(user_url, headers=headers)
-        user_model = r.json()
+        r = yield client.fetch(user_url, headers=headers)
+        user_model = json_loads(r.body)
 
         # if server is not 'active', request launch
         if server_name not in user_model.get("servers", {}):
-            r = requests.post(f"{user_url}/servers/{server_name}", headers=headers)
-            r = requests.get(user_url, headers=headers)
-            user_model = r.json()
+            yield client.fetch(
+                f"{user_url}/servers/{server_name}", method="POST", headers=headers, body=""
+            )
+            r = yield client.fetch(user_url, headers=headers)
+            user_model = json_loads(r.body)
 
         # wait for server to be ready using progress API
         progress_url = user_model["servers"][server_name]["progress_url"]
-        for event in self.event_stream(f"{hub_url}{progress_url}", headers=headers):
-            if event.get("ready"):
-                server_url = event["url"]
-                break
-        else:
+        event = yield self.event_stream(f"{hub_url}{progress_url}", headers=headers)
+        if event is None:
             # server never ready
             raise ValueError(f"{log_name} never started!")
+        server_url = event["url"]
 
         # at this point, we know the server is ready and waiting to receive requests
         # return the full URL where the server can be accessed
         return f"{hub_url}{server_url}"
 
+    @gen.coroutine
     def stop_server(self, hub_url, user, server_name=""):
         """Stop a server via the JupyterHub API
 
@@ -306,20 +464,83 @@ class Jupyter(Analyzer):
         user_url = f"{hub_url}/hub/api/users/{user}"
         server_url = f"{user_url}/servers/{server_name}"
         log_name = f"{user}/{server_name}".rstrip("/")
+        headers = self.get_conf("input", "handler_http_headers")
+        client = AsyncHTTPClient()
+
+        # step 2: request the server to stop, 204 means it's already stopped
+        r = yield client.fetch(server_url, method="DELETE", headers=headers)
+        if r.code == 204:
+            return
 
-        # wait for server to be done stopping
+        # wait for server to be done stopping, polling faster at the beginning
+        delay = 0.05
         while True:
-            r = requests.get(
-                user_url, headers=self.get_conf("input", "handler_http_headers")
-            )
-            user_model = r.json()
+            r = yield client.fetch(user_url, headers=headers)
+            user_model = json_loads(r.body)
             if server_name not in user_model.get("servers", {}):
                 return
             server = user_model["servers"][server_name]
             if not server["pending"]:
                 raise ValueError(f"Waiting for {log_name}, but no longer pending.")
             # wait to poll again
-            time.sleep(1)
+            yield gen.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+    def build_output_paths(self, path):
+        """This is used to build the output paths of an executed notebook
+
+        Args:
+            path (str): Path of the input notebook
+
+        Returns:
+            tuple: Path used to store the output notebook and link to access it directly
+        """
+        return (
+            f"{self.output_prefix}{path}{self.output_suffix}",
+            f"{self.output_prefix_direct}{path}",
+        )
+
+    def write_notebook(self, nb, path):
+        """This function is used to store an executed notebook without waiting for the write to be done
+
+        The notebook is serialized immediately so it can be updated right after the call.
+
+        Args:
+            nb (nbformat<NotebookNode>): Notebook structure
+            path (str): Path used to store the output notebook
+
+        Returns:
+            Future: Resolved once the notebook is stored
+        """
+        if self.get_conf("output", "is_http"):
+            # Store the notebook through the contents API
+            return AsyncHTTPClient().fetch(
+                path,
+                method="PUT",
+                headers=self.get_conf("output", "handler_http_headers"),
+                body=json_dumps(
+                    {"type": "notebook", "format": "json", "path": path, "content": nb}
+                ),
+            )
+        else:
+            # Let papermill handle other locations from a thread
+            return IOLoop.current().run_in_executor(
+                None, papermill_io.write, nbformat.writes(nb), path
+            )
+
+    def check_writes(self, writes):
+        """This function is used to report an error if one of the finished notebook writes failed
+
+        Args:
+            writes (list): Futures returned by write_notebook
+        """
+        for write in writes:
+            if write.done() and write.exception() is not None:
+                self.error(
+                    "ERROR - Something went wrong while storing an output notebook: {0}".format(
+                        write.exception()
+                    )
+                )
 
     def create_output_path(self, hostname, headers=None):
         """This function is used to create the output path subfolders if they aren't existing yet
@@ -339,32 +560,113 @@ class Jupyter(Analyzer):
             )
 
             # Check if folder is existing
-            status_code = requests.get(final_path, headers=headers).status_code
+            status_code = self.http_session.get(final_path, headers=headers).status_code
             # If the folder exists, it will return a status code 200. Otherwise, we will need to create
             if status_code != 200:
                 # Create the folder
-                requests.put(final_path, json={"name": sp, "type": "directory"}, headers=headers)
+                self.http_session.put(final_path, json={"name": sp, "type": "directory"}, headers=headers)
+
+
+    def kernel_message(self, msg_id, msg_type, content):
+        """This function is used to build a message for the shell channel of a remote kernel
+
+        Args:
+            msg_id (str): Identifier of the message, used to match the responses
+            msg_type (str): Type of the message (ex: "execute_request")
+            content (dict): Content of the message
+
+        Returns:
+            str: JSON message to be sent through the websocket
+        """
+        return json_dumps(
+            {
+                "header": {
+                    "username": "",
+                    "version": "5.4",
+                    "session": "",
+                    "msg_id": msg_id,
+                    "msg_type": msg_type,
+                },
+                "parent_header": {},
+                "channel": "shell",
+                "content": content,
+                "metadata": {},
+                "buffers": {},
+            }
+        )
+
+    @gen.coroutine
+    def get_or_create_kernel(self):
+        """This function is used to start a remote kernel (force to python3) only if none was started yet
+
+        Returns:
+            str: Identifier of the remote kernel
+        """
+        if self.kernel_id is None:
+            # Execute a POST request to start a kernel and get the kernel id created
+            response = yield AsyncHTTPClient().fetch(
+                self.get_conf("input", "server_uri_http_api_kernels"),
+                method="POST",
+                headers=self.get_conf("input", "handler_http_headers"),
+                body=json_dumps({"name": "python3"}),
+            )
+            self.kernel_id = json_loads(response.body)["id"]
 
+        return self.kernel_id
 
     @gen.coroutine
-    def execute_notebook_remotely(self):
-        """This function is used to execute a notebook thanks to a remote Jupyter instance using the REST API and a dedicated websocket
+    def restart_kernel(self):
+        """This function is used to restart the remote kernel, or to forget it if it can't be restarted anymore"""
+        try:
+            yield AsyncHTTPClient().fetch(
+                "{}/{}/restart".format(
+                    self.get_conf("input", "server_uri_http_api_kernels"),
+                    url_escape(self.kernel_id),
+                ),
+                method="POST",
+                headers=self.get_conf("input", "handler_http_headers"),
+                body="",
+            )
+        except HTTPClientError:
+            # The kernel is gone, a new one will be started
+            self.kernel_id = None
+
+    @gen.coroutine
+    def is_kernel_alive(self, ws):
+        """This function is used to check that a remote kernel still answers through the given websocket
+
+        Args:
+            ws (WebSocketClientConnection): Websocket connected to the remote kernel
 
         Returns:
-            nbformat<NotebookNode>: Output of the executed notebook
+            bool: True if a kernel_info_reply was received in time, False otherwise
         """
+        msg_id = uuid4().hex
+        try:
+            yield ws.write_message(self.kernel_message(msg_id, "kernel_info_request", {}))
+            while True:
+                msg = yield gen.with_timeout(
+                    datetime.timedelta(seconds=10), ws.read_message()
+                )
+                if msg is None:
+                    return False
+                msg = json_loads(msg)
+                if (
+                    msg["msg_type"] == "kernel_info_reply"
+                    and msg["parent_header"].get("msg_id") == msg_id
+                ):
+                    return True
+        except (gen.TimeoutError, WebSocketClosedError):
+            return False
 
-        # Initialize an async HTTP client
-        client = AsyncHTTPClient()
+    @gen.coroutine
+    def connect_kernel_websocket(self):
+        """This function is used to open a new websocket to the remote kernel, starting the kernel if needed
 
-        # Execute a POST request to start a kernel (force to python3) and get the kernel id created
-        response = yield client.fetch(
-            self.get_conf("input", "server_uri_http_api_kernels"),
-            method="POST",
-            headers=self.get_conf("input", "handler_http_headers"),
-            body=json_encode({"name": "python3"}),
-        )
-        kernel_id = json_decode(response.body)["id"]
+        Returns:
+            WebSocketClientConnection: Websocket connected to the remote kernel
+        """
+        kernel_id = yield self.get_or_create_kernel()
 
         # Prepare the websocket request to communicate with the remote kernel
         ws_req = HTTPRequest(
@@ -375,21 +677,104 @@ class Jupyter(Analyzer):
             headers=self.get_conf("input", "handler_http_headers"),
         )
 
-        # Connect to websocket
-        ws = yield websocket_connect(ws_req)
+        # Connect to websocket, allowing compression and large outputs (ex: images)
+        ws = yield websocket_connect(
+            ws_req,
+            compression_options={},
+            max_message_size=64 * 1024 * 1024,
+            ping_interval=30,
+            ping_timeout=20,
+        )
+
+        return ws
+
+    @gen.coroutine
+    def get_or_create_websocket(self):
+        """This function is used to get a websocket connected to the remote kernel, reusing the current one while it is alive
+
+        Returns:
+            WebSocketClientConnection: Websocket connected to the remote kernel
+        """
+        if self.kernel_ws is not None:
+            alive = yield self.is_kernel_alive(self.kernel_ws)
+            if alive:
+                return self.kernel_ws
+
+            # Drop the broken connection
+            self.kernel_ws.close()
+            self.kernel_ws = None
+
+            # Only the connection may have dropped, so try to reconnect to the same kernel first
+            ws = None
+            try:
+                ws = yield self.connect_kernel_websocket()
+                alive = yield self.is_kernel_alive(ws)
+            except (HTTPClientError, StreamClosedError, OSError):
+                alive = False
+            if alive:
+                self.kernel_ws = ws
+                return self.kernel_ws
+            if ws is not None:
+                ws.close()
+
+            # The kernel doesn't answer anymore, try to recover it
+            yield self.restart_kernel()
+
+        self.kernel_ws = yield self.connect_kernel_websocket()
+
+        return self.kernel_ws
+
+    @gen.coroutine
+    def shutdown_kernel(self):
+        """This function is used to close the websocket and to stop the remote kernel once all jobs are done"""
+        if self.kernel_ws is not None:
+            self.kernel_ws.close()
+            self.kernel_ws = None
+
+        if self.kernel_id is not None:
+            try:
+                yield AsyncHTTPClient().fetch(
+                    "{}/{}".format(
+                        self.get_conf("input", "server_uri_http_api_kernels"),
+                        url_escape(self.kernel_id),
+                    ),
+                    method="DELETE",
+                    headers=self.get_conf("input", "handler_http_headers"),
+                )
+            except HTTPClientError:
+                # The kernel is already gone
+                pass
+            self.kernel_id = None
+
+    @gen.coroutine
+    def execute_notebook_remotely(self):
+        """This function is used to execute a notebook thanks to a remote Jupyter instance using the REST API and a dedicated websocket
+
+        Returns:
+            nbformat<NotebookNode>: Output of the executed notebook
+        """
+
+        # Recover the configuration once instead of for each notebook
+        in_token = self.get_conf("input", "handler_http_service_api_token")
+        in_contents = self.get_conf("input", "server_uri_http_api_contents")
+
+        # Precompute the static parts of the input notebook paths
+        in_prefix = f"{in_contents}/"
+        in_suffix = f"?token={in_token}"
 
         # Prepare results variable
         results = []
+        writes = []
 
         # Load the input notebook
-        for path in iter(self.input_paths):
-            nb_input = pm.iorw.load_notebook_node(
-                "{0}/{1}?token={2}".format(
-                    self.get_conf("input", "server_uri_http_api_contents"),
-                    path,
-                    self.get_conf("input", "handler_http_service_api_token"),
-                )
-            )
+        for path in self.input_paths:
+            # Stop as soon as a previous output notebook failed to be stored
+            self.check_writes(writes)
+
+            nb_input = pm.iorw.load_notebook_node(f"{in_prefix}{path}{in_suffix}")
+
+            # Get the websocket to the remote kernel, reusing it between notebooks
+            ws = yield self.get_or_create_websocket()
 
             # Parametrize the input notebook to be the output notebook
             nb_output = pm.parameterize.parameterize_notebook(
@@ -400,108 +785,87 @@ class Jupyter(Analyzer):
             # Start timer
             start_time = time.time()
 
-            # Execute the output notebooks on relevant cell_type
-            for cell in iter(nb_output["cells"]):
-                # Only execute cell_type equals to "code"
-                if cell["cell_type"] == "code":
-                    # Generate a message ID
-                    msg_id = uuid4().hex
-
-                    # Send an execute request to process the code
-                    ws.write_message(
-                        json_encode(
-                            {
-                                "header": {
-                                    "username": "",
-                                    "version": "5.4",
-                                    "session": "",
-                                    "msg_id": msg_id,
-                                    "msg_type": "execute_request",
-                                },
-                                "parent_header": {},
-                                "channel": "shell",
-                                "content": {
-                                    "code": cell["source"],
-                                    "silent": False,
-                                    "store_history": True,
-                                    "user_expressions": {},
-                                    "allow_stdin": False,
-                                },
-                                "metadata": {},
-                                "buffers": {},
-                            }
-                        )
+            # Keep the code cells and generate one message ID for each of them
+            # Only execute cell_type equals to "code"
+            code_cells = [
+                cell for cell in nb_output["cells"] if cell["cell_type"] == "code"
+            ]
+
+            # Send all the execute requests at once, the kernel processes them in order
+            # Each message ID is mapped to its cell, the outputs collected for it and
+            # the completion events received so far ("execute_reply" and "idle")
+            pending = {}
+            for cell in code_cells:
+                msg_id = uuid4().hex
+                pending[msg_id] = (cell, [], set())
+                ws.write_message(
+                    self.kernel_message(
+                        msg_id,
+                        "execute_request",
+                        {
+                            "code": cell["source"],
+                            "silent": False,
+                            "store_history": True,
+                            "user_expressions": {},
+                            "allow_stdin": False,
+                        },
+                    )
+                )
+
+            # Look for the answers by analyzing the websocket traffic
+            while pending:
+                # Get the next message
+                msg = yield ws.read_message()
+                if msg is None:
+                    self.error(
+                        "ERROR - The websocket to the remote kernel was closed before the end of the execution"
                     )
 
-                    # Look for the answer by analyzing the websocket traffic
-                    while 1:
-                        # Get the next message
-                        msg = yield ws.read_message()
-
-                        # Parse the message
-                        msg = json_decode(msg)
-
-                        # Get interesting information
-                        msg_type = msg["msg_type"]
-                        parent_msg_id = msg["parent_header"]["msg_id"]
-
-                        # Process any response from our request
-                        if parent_msg_id == msg_id:
-                            # Case 1: Handle error message type from the kernel
-                            if msg_type == "error":
-                                self.error(
-                                    "ERROR - Something went wrong during the code processing. Remote kernel returns: "
-                                    + str(msg)
-                                )
-                                break
-                            # Case 2: No stdout but request done
-                            elif msg_type == "execute_reply":
-                                # No content*
-                                cell["outputs"] = []
-                                break
-                            # Case 3: Stdout/stderr content detected
-                            elif msg_type == "stream":
-                                cell["outputs"] = [
-                                    nbformat.v4.nbbase.output_from_msg(msg)
-                                ]
-                                break
-                            # Case 4: Display data detected
-                            elif msg_type == "display_data":
-                                cell["outputs"] = [
-                                    nbformat.v4.nbbase.output_from_msg(msg)
-                                ]
-                                break
-                            # Otherwise, drop the message
+                # Parse the message
+                msg = json_loads(msg)
+
+                # Get interesting information
+                msg_type = msg["msg_type"]
+                parent_msg_id = msg["parent_header"].get("msg_id")
+
+                # Process any response from our requests, otherwise drop the message
+                entry = pending.get(parent_msg_id)
+                if entry is None:
+                    continue
+                (cell, outputs, completion) = entry
+
+                # Case 1: Handle error message type from the kernel
+                if msg_type == "error":
+                    self.error(
+                        "ERROR - Something went wrong during the code processing. Remote kernel returns: "
+                        + str(msg)
+                    )
+                # Case 2: Request done on the shell channel
+                elif msg_type == "execute_reply":
+                    completion.add("execute_reply")
+                # Case 3: All outputs sent on the iopub channel
+                elif msg_type == "status" and msg["content"].get("execution_state") == "idle":
+                    completion.add("idle")
+                # Case 4: Stdout/stderr content detected
+                elif msg_type == "stream":
+                    outputs.append(stream_output(msg))
+                # Case 5: Display data detected
+                elif msg_type == "display_data":
+                    outputs.append(display_output(msg))
+
+                # The shell and iopub channels are not ordered with each other, so the
+                # cell is only done once both the reply and the idle status were received
+                if len(completion) == 2:
+                    cell["outputs"] = outputs
+                    del pending[parent_msg_id]
 
             # Stop timer
             timer = time.time() - start_time
 
             # Write the notebook after execution
             # Build output path notebook
-            if self.get_conf("output", "handler_type") is HttpHandler:
-                output_path = "{0}/{1}/{2}-{3}?token={4}".format(
-                    self.get_conf("output", "server_uri_http_api_contents"),
-                    self.output_folder,
-                    self.id,
-                    path,
-                    self.get_conf("output", "handler_http_service_api_token"),
-                )
-                output_path_direct = "{0}/user/{1}/tree/{2}/{3}-{4}".format(
-                    self.get_conf("output", "hostname"),
-                    self.get_conf("output", "handler_http_user"),
-                    self.output_folder,
-                    self.id,
-                    path,
-                )
-            else:
-                output_path = "{0}/{1}/{2}".format(
-                    self.get_conf("output", "hostname"),
-                    self.output_folder,
-                    self.id,
-                    path,
-                )
-                output_path_direct = output_path
-            pm.iorw.write_ipynb(nb_output, output_path)
+            (output_path, output_path_direct) = self.build_output_paths(path)
+            writes.append(self.write_notebook(nb_output, output_path))
 
             # Add the timer information
             nb_output["duration"] = round(timer, 3)
@@ -514,8 +878,12 @@ class Jupyter(Analyzer):
 
             results.append(nb_output)
 
-        # Close the websocket once the notebook is processed
-        ws.close()
+        # Wait for all the output notebooks to be stored, failures are reported below
+        try:
+            yield gen.multi(writes, quiet_exceptions=Exception)
+        except Exception:
+            pass
+        self.check_writes(writes)
 
         return results
 
@@ -523,72 +891,37 @@ class Jupyter(Analyzer):
         """Describe the execution of the analyzer"""
         Analyzer.run(self)
 
-        # Initialize an HTML exporter to render long HTML reports
-        html_exporter = HTMLExporter(template_name="classic")
-        # Intialize the variable to store all notebooks results
-        results = []
+        try:
+            # Intialize the variable to store all notebooks results
+            results = []
 
-        # Check how to execute the notebooks (local or remote)
-        if (
-            self.input_execute_remotely is True
-            and self.get_conf("input", "handler_type") is HttpHandler
-        ):
-            # Execute remotely using a websocket through HTTP to communicate with the remote kernel
-            results = IOLoop.current().run_sync(self.execute_notebook_remotely)
+            # Recover the configuration once instead of for each notebook
+            in_is_http = self.get_conf("input", "is_http")
 
-        else:
-            # Execute locally through papermill
-
-            # Loop over all the notebooks to be run
-            for path in self.input_paths:
-                # Build input path notebook
-                if self.get_conf("input", "handler_type") is HttpHandler:
-                    input_notebook = "{0}/{1}?token={2}".format(
-                        self.get_conf("input", "server_uri_http_api_contents"),
-                        path,
-                        self.get_conf("input", "handler_http_service_api_token"),
-                    )
-                else:
-                    input_notebook = self.get_conf("input", "hostname") + path
-
-                # Build output path notebook
-                if self.get_conf("output", "handler_type") is HttpHandler:
-                    output_notebook = "{0}/{1}/{2}-{3}?token={4}".format(
-                        self.get_conf("output", "server_uri_http_api_contents"),
-                        self.output_folder,
-                        self.id,
-                        path,
-                        self.get_conf("output", "handler_http_service_api_token"),
-                    )
-                    output_notebook_direct = "{0}/user/{1}/tree/{2}/{3}-{4}".format(
-                        self.get_conf("output", "hostname"),
-                        self.get_conf("output", "handler_http_user"),
-                        self.output_folder,
-                        self.id,
-                        path,
-                    )
+            # Check how to execute the notebooks (local or remote)
+            if self.input_execute_remotely is True and in_is_http:
+                # Execute remotely using a websocket through HTTP to communicate with the remote kernel
+                results = IOLoop.current().run_sync(self.execute_notebook_remotely)
+
+            else:
+                # Execute locally through papermill
+                in_token = self.get_conf("input", "handler_http_service_api_token")
+                in_contents = self.get_conf("input", "server_uri_http_api_contents")
+                in_hostname = self.get_conf("input", "hostname")
+
+                # Precompute the static parts of the input notebook paths
+                if in_is_http:
+                    in_prefix = f"{in_contents}/"
+                    in_suffix = f"?token={in_token}"
                 else:
-                    output_notebook = "{0}/{1}/{2}-".format(
-                        self.get_conf("output", "hostname"),
-                        self.output_folder,
-                        self.id,
-                        path,
-                    )
-                    output_notebook_direct = output_notebook
+                    in_prefix = in_hostname
+                    in_suffix = ""
 
-                # Initialize the output notebook object result
-                nb_output = None
+                def execute_notebook_locally(path):
+                    # Build input and output paths notebook
+                    input_notebook = f"{in_prefix}{path}{in_suffix}"
+                    (output_notebook, output_notebook_direct) = self.build_output_paths(path)
 
-                # Check how to execute the notebooks (local or remote)
-                if (
-                    self.input_execute_remotely is True
-                    and self.get_conf("input", "handler_type") is HttpHandler
-                ):
-                    # Execute remotely using a websocket through HTTP to communicate with the remote kernel
-                    IOLoop.current().run_sync(self.execute_notebook_remotely)
-
-                else:
-                    # Execute locally through papermill
                     # Execute the notebook
                     nb_output = pm.execute_notebook(
                         input_path=input_notebook,
@@ -599,23 +932,12 @@ class Jupyter(Analyzer):
                     )
 
                     # Sanitize secrets
-                    nb_output["metadata"]["papermill"]["input_path"] = nb_output["metadata"]["papermill"]["input_path"].replace(
-                        "?token={0}".format(
-                            self.get_conf("output", "handler_http_service_api_token")
-                        ),
-                        "",
-                    )
-                    nb_output["metadata"]["papermill"]["output_path"] = nb_output["metadata"]["papermill"]["output_path"].replace(
-                        "?token={0}".format(
-                            self.get_conf("output", "handler_http_service_api_token")
-                        ),
-                        "",
-                    )
+                    papermill_metadata = nb_output["metadata"]["papermill"]
+                    papermill_metadata["input_path"] = papermill_metadata["input_path"].replace(in_suffix, "")
+                    papermill_metadata["output_path"] = papermill_metadata["output_path"].replace(self.output_suffix, "")
 
                     # Duplicate duration time
-                    nb_output["duration"] = round(
-                        nb_output["metadata"]["papermill"]["duration"], 3
-                    )
+                    nb_output["duration"] = round(papermill_metadata["duration"], 3)
 
                     # Add the output link if we want to access it
                     nb_output["output_notebook"] = output_notebook_direct
@@ -623,18 +945,35 @@ class Jupyter(Analyzer):
                     # Add the name of the executed notebook
                     nb_output["name"] = path
 
-                # Store the result
-                results.append(nb_output)
-
-        # Convert the content directly to HTML and add it to the payload if asked
-        if self.any_generate_html:
-            for nb in results:
-                (body, ressources) = html_exporter.from_notebook_node(nb)
-                nb["html"] = body
-
-        # Report the results
-        report_results = {"notebooks": results}
-        self.report(report_results)
+                    return nb_output
+
+                # Run all the notebooks concurrently, each one in its own kernel, keeping the results in order
+                with ThreadPoolExecutor(
+                    max_workers=max(1, min(len(self.input_paths), 4))
+                ) as executor:
+                    results = list(executor.map(execute_notebook_locally, self.input_paths))
+
+            # Convert the content directly to HTML and add it to the payload if asked
+            if self.any_generate_html:
+                if len(results) > 1:
+                    # Render the notebooks in parallel as the templating is CPU bound
+                    with ProcessPoolExecutor(
+                        max_workers=min(len(results), os.cpu_count() or 1),
+                        initializer=get_html_exporter,
+                    ) as executor:
+                        bodies = list(executor.map(render_html, results))
+                else:
+                    bodies = [render_html(nb) for nb in results]
+                for nb, body in zip(results, bodies):
+                    nb["html"] = body
+
+            # Report the results
+            report_results = {"notebooks": results}
+            self.report(report_results)
+        finally:
+            # Stop the remote kernel and release the HTTP connections, even if the job failed
+            IOLoop.current().run_sync(self.shutdown_kernel)
+            self.http_session.close()
 
 
 if __name__ == "__main__":
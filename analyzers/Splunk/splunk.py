@@ -200,44 +200,37 @@ class Splunk(Analyzer):
 
     def summary(self, raw):
         taxonomies = []
-        value = 0
         namespace = "Splunk"
-        taxonomyResults = {"level": "safe", "namespace": namespace, "predicate": "Results", "value": 0}
 
-        # (Optional) These taxonomies will be added only if a field "level" is found
-        taxonomyInfo = {"level": "info", "namespace": namespace, "predicate": "Info", "value": 0}
-        taxonomySafe = {"level": "safe", "namespace": namespace, "predicate": "Safe", "value": 0}
-        taxonomySuspicious = {"level": "suspicious", "namespace": namespace, "predicate": "Suspicious", "value": 0}
-        taxonomyMalicious = {"level": "malicious", "namespace": namespace, "predicate": "Malicious", "value": 0}
-
-        # Process all requests with the given taxonomies
+        # Accumulate all requests counters in a single pass
+        total, info, safe, suspicious, malicious = 0, 0, 0, 0, 0
         for savedsearch in raw["savedsearches"]:
-            taxonomyResults["value"] += savedsearch["resultCount"]  
-            
-            if "levels" in savedsearch:
-                levels = savedsearch["levels"]
-                taxonomyInfo["value"] += levels["info"]    
-                taxonomySafe["value"] += levels["safe"]    
-                taxonomySuspicious["value"] += levels["suspicious"]    
-                taxonomyMalicious["value"] += levels["malicious"]    
+            total += savedsearch["resultCount"]
+
+            # (Optional) These counters are filled only if a field "level" is found
+            levels = savedsearch.get("levels")
+            if levels:
+                info += levels["info"]
+                safe += levels["safe"]
+                suspicious += levels["suspicious"]
+                malicious += levels["malicious"]
 
         # Add results taxonomy anyway
         # Change the level if there is any result
-        if taxonomyResults["value"]>0:
-            taxonomyResults["level"] = "suspicious"
+        if total > 0:
+            taxonomies.append(self.build_taxonomy("suspicious", namespace, "Results", total))
         else:
-            taxonomyResults["value"] = "None"
-        taxonomies.append(self.build_taxonomy(taxonomyResults["level"], taxonomyResults["namespace"], taxonomyResults["predicate"], taxonomyResults["value"]))
+            taxonomies.append(self.build_taxonomy("safe", namespace, "Results", "None"))
 
         # Only add optional taxonomies if they are not null
-        if taxonomyInfo["value"] > 0:
-            taxonomies.append(self.build_taxonomy(taxonomyInfo["level"], taxonomyInfo["namespace"], taxonomyInfo["predicate"], taxonomyInfo["value"]))
-        if taxonomySafe["value"] > 0:
-            taxonomies.append(self.build_taxonomy(taxonomySafe["level"], taxonomySafe["namespace"], taxonomySafe["predicate"], taxonomySafe["value"]))
-        if taxonomySuspicious["value"] > 0:
-            taxonomies.append(self.build_taxonomy(taxonomySuspicious["level"], taxonomySuspicious["namespace"], taxonomySuspicious["predicate"], taxonomySuspicious["value"]))
-        if taxonomyMalicious["value"] > 0:
-            taxonomies.append(self.build_taxonomy(taxonomyMalicious["level"], taxonomyMalicious["namespace"], taxonomyMalicious["predicate"], taxonomyMalicious["value"]))
+        if info > 0:
+            taxonomies.append(self.build_taxonomy("info", namespace, "Info", info))
+        if safe > 0:
+            taxonomies.append(self.build_taxonomy("safe", namespace, "Safe", safe))
+        if suspicious > 0:
+            taxonomies.append(self.build_taxonomy("suspicious", namespace, "Suspicious", suspicious))
+        if malicious > 0:
+            taxonomies.append(self.build_taxonomy("malicious", namespace, "Malicious", malicious))
 
 
         return {"taxonomies": taxonomies}